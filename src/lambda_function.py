@@ -1,29 +1,40 @@
-import json
+import os
+import orjson
 from nba_stats import NBAStatsPipeline
 
+# Response bodies are constant, so serialize them once
+_OK_BODY = orjson.dumps('Successfully updated NBA stats').decode()
+_ERR_FETCH_BODY = orjson.dumps('Failed to fetch NBA stats').decode()
+
+# Created once per execution context and reused across warm invocations
+PIPELINE = NBAStatsPipeline()
+
+# Table creation is a deploy-time concern; only opt in when explicitly asked
+CREATE_TABLE_IF_MISSING = os.getenv('CREATE_TABLE_IF_MISSING') == '1'
+
 def lambda_handler(event, context):
     try:
-        pipeline = NBAStatsPipeline()
-        
-        # Set up DynamoDB table if needed
-        pipeline.setup_dynamodb_table()
-        
+        # Done here rather than at import so the table_exists waiter isn't
+        # bound by the init timeout and setup errors return a 500
+        if CREATE_TABLE_IF_MISSING:
+            PIPELINE.setup_dynamodb_table()
+
         # Fetch and store stats
-        stats = pipeline.fetch_player_stats()
+        stats = PIPELINE.fetch_player_stats()
         if stats:
-            pipeline.store_team_stats(stats)
+            PIPELINE.store_team_stats(stats)
             return {
                 'statusCode': 200,
-                'body': json.dumps('Successfully updated NBA stats')
+                'body': _OK_BODY
             }
         else:
             return {
                 'statusCode': 500,
-                'body': json.dumps('Failed to fetch NBA stats')
+                'body': _ERR_FETCH_BODY
             }
             
     except Exception as e:
         return {
             'statusCode': 500,
-            'body': json.dumps(f'Error: {str(e)}')
+            'body': orjson.dumps(f'Error: {str(e)}').decode()
         }
@@ -1,25 +1,117 @@
 import os
 import json
+import time
+import random
+import hashlib
+import operator
+import itertools
 import boto3
+import orjson
 import requests
 import logging
 import watchtower
-from datetime import datetime
-from pythonjsonlogger import jsonlogger
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from boto3.dynamodb.types import DYNAMODB_CONTEXT, TypeSerializer
+from botocore.config import Config
 from dotenv import load_dotenv
-from decimal import Decimal
 
 # Load environment variables
 load_dotenv()
 
+# BatchWriteItem accepts at most 25 put requests per call
+BATCH_WRITE_SIZE = 25
+MAX_BATCH_RETRIES = 8
+MAX_WRITE_WORKERS = 4
+MAX_FETCH_WORKERS = 4
+# Seconds a fetched standings response is served from memory
+STANDINGS_CACHE_TTL = 300
+# TransactWriteItems accepts at most 100 actions per call
+MAX_TRANSACTION_SIZE = 100
+
+_SERIALIZER = TypeSerializer()
+
+# Shared by every AWS client; adaptive retries back off with a token bucket under throttling
+BOTO_CONFIG = Config(
+    retries={'mode': 'adaptive', 'max_attempts': 10},
+    tcp_keepalive=True,
+    max_pool_connections=16,
+    connect_timeout=2,
+    read_timeout=5
+)
+
+# Numeric fields copied from each standings record into the Stats map
+_STAT_KEYS = (
+    'Wins',
+    'Losses',
+    'Percentage',
+    'PointsPerGameFor',
+    'PointsPerGameAgainst',
+    'HomeWins',
+    'HomeLosses',
+    'AwayWins',
+    'AwayLosses',
+    'LastTenWins',
+    'LastTenLosses'
+)
+# Pulls all stat values from a record in one C-level call
+_STATS_GET = operator.itemgetter(*_STAT_KEYS)
+
+def to_decimal(value):
+    """Convert floats to DynamoDB-safe Decimals, leaving other values as is"""
+    if isinstance(value, float):
+        # Parse the shortest round-trip string (108.3, not 108.29999...); boto3's
+        # context traps anything DynamoDB can't store exactly
+        return DYNAMODB_CONTEXT.create_decimal(str(value))
+    return value
+
+def chunked(iterable, size):
+    """Yield successive lists of at most `size` items"""
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+# Attributes every LogRecord has; anything else on a record came from `extra`
+_RECORD_ATTRS = frozenset(
+    logging.LogRecord('', 0, '', 0, '', (), None).__dict__
+) | {'message', 'asctime'}
+
+class JsonFormatter(logging.Formatter):
+    """Format records as single-line JSON, including any `extra` fields"""
+
+    def format(self, record):
+        entry = {
+            'asctime': self.formatTime(record),
+            'name': record.name,
+            'levelname': record.levelname,
+            'message': record.getMessage()
+        }
+        entry.update(
+            (k, v) for k, v in record.__dict__.items() if k not in _RECORD_ATTRS
+        )
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry['stack_info'] = self.formatStack(record.stack_info)
+        try:
+            return orjson.dumps(
+                entry, default=str, option=orjson.OPT_NON_STR_KEYS
+            ).decode()
+        except TypeError:
+            # orjson rejects some values stdlib json accepts (e.g. ints over 64 bits)
+            return json.dumps(entry, default=str)
+
 def setup_logger():
     logger = logging.getLogger('NBAStatsPipeline')
+    # Already configured by an earlier pipeline in this process
+    if logger.handlers:
+        return logger
     logger.setLevel(logging.INFO)
 
     # JSON formatter for structured logging
-    json_formatter = jsonlogger.JsonFormatter(
-        fmt='%(asctime)s %(name)s %(levelname)s %(message)s'
-    )
+    json_formatter = JsonFormatter()
 
     # Console handler
     console_handler = logging.StreamHandler()
@@ -30,6 +122,7 @@ def setup_logger():
     try:
         cloudwatch_handler = watchtower.CloudWatchLogHandler(
             log_group_name='NBAStatsPipeline',
+            boto3_client=boto3.client('logs', config=BOTO_CONFIG),
             stream_name=f'stats-collection-{datetime.now().strftime("%Y-%m-%d")}'
         )
         cloudwatch_handler.setFormatter(json_formatter)
@@ -40,12 +133,44 @@ def setup_logger():
     return logger
 
 class NBAStatsPipeline:
+    # Set once the table is known to exist so later calls skip the API round trip
+    _table_initialized = False
+
     def __init__(self):
         self.logger = setup_logger()
         self.api_key = os.getenv('SPORTDATA_API_KEY')
         self.base_url = "https://api.sportsdata.io/v3/nba"
-        self.dynamodb = boto3.resource('dynamodb')
+
+        # Pooled HTTP session so warm invocations reuse the TCP/TLS connection
+        self.session = requests.Session()
+        self.session.headers.update({"Ocp-Apim-Subscription-Key": self.api_key})
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=16,
+            max_retries=Retry(
+                total=3,
+                backoff_factor=0.3,
+                status_forcelist=(429, 500, 502, 503, 504),
+                # Hand the last response to raise_for_status() so the status is logged
+                raise_on_status=False,
+                # A long Retry-After on a 429 could sleep past the Lambda timeout
+                respect_retry_after_header=False
+            )
+        )
+        self.session.mount("https://", adapter)
+
         self.table_name = os.getenv('DYNAMODB_TABLE_NAME')
+        # Low-level client only; items are serialized with TypeSerializer
+        self.ddb = boto3.client('dynamodb', config=BOTO_CONFIG)
+
+        # (fetched_at, data) per request key, reused across warm invocations
+        self._cache = {}
+
+        # Last stored StatsHash per TeamID, reused across warm invocations
+        self._stats_hashes = {}
+
+        # Display name per TeamID; names don't change within a container's lifetime
+        self._name_cache = {}
 
         self.logger.info("Initialized NBA Stats Pipeline", 
                         extra={
@@ -54,24 +179,21 @@ class NBAStatsPipeline:
                             'table_name': self.table_name
                         })
 
-    def convert_floats_to_decimals(self, item):
-        """Helper method to convert all float values to Decimals"""
-        if isinstance(item, float):
-            return Decimal(str(item))
-        elif isinstance(item, dict):
-            return {k: self.convert_floats_to_decimals(v) for k, v in item.items()}
-        elif isinstance(item, list):
-            return [self.convert_floats_to_decimals(v) for v in item]
-        return item
-
     def setup_dynamodb_table(self):
         """Set up DynamoDB table if it doesn't exist"""
+        if NBAStatsPipeline._table_initialized:
+            return
+
         try:
             self.logger.info(f"Setting up DynamoDB table: {self.table_name}")
             
-            # Create table if it doesn't exist
+            # Check for the table first; only create it if it's missing
             try:
-                table = self.dynamodb.create_table(
+                self.ddb.describe_table(TableName=self.table_name)
+                self.logger.info(f"Table {self.table_name} already exists")
+                
+            except self.ddb.exceptions.ResourceNotFoundException:
+                self.ddb.create_table(
                     TableName=self.table_name,
                     KeySchema=[
                         {
@@ -100,16 +222,12 @@ class NBAStatsPipeline:
                 )
                 
                 # Wait for table to be created
-                table.meta.client.get_waiter('table_exists').wait(
+                self.ddb.get_waiter('table_exists').wait(
                     TableName=self.table_name
                 )
                 self.logger.info(f"Created table {self.table_name}")
                 
-            except self.dynamodb.meta.client.exceptions.ResourceInUseException:
-                self.logger.info(f"Table {self.table_name} already exists")
-                table = self.dynamodb.Table(self.table_name)
-                
-            return table
+            NBAStatsPipeline._table_initialized = True
             
         except Exception as e:
             self.logger.error(f"Failed to set up DynamoDB table", 
@@ -121,6 +239,13 @@ class NBAStatsPipeline:
 
     def fetch_player_stats(self, season="2024"):
         """Fetch player statistics from sportsdata.io"""
+        key = ('standings', season)
+        now = time.monotonic()
+        hit = self._cache.get(key)
+        if hit and now - hit[0] < STANDINGS_CACHE_TTL:
+            self.logger.info("Using cached standings", extra={'season': season})
+            return hit[1]
+
         try:
             url = f"{self.base_url}/scores/json/Standings/{season}"
             self.logger.info(f"Fetching data from API", 
@@ -129,19 +254,22 @@ class NBAStatsPipeline:
                                'season': season
                            })
 
-            headers = {
-                "Ocp-Apim-Subscription-Key": self.api_key
-            }
-            
-            response = requests.get(url, headers=headers)
+            response = self.session.get(url, timeout=(3.05, 10))
             response.raise_for_status()
             
-            data = response.json()
+            # Standings is one small array (30 teams), so a single orjson pass is
+            # cheapest; stream with ijson only if a large endpoint is added
+            data = orjson.loads(response.content)
+            # Standings returns every team in one unpaginated list
+            if not isinstance(data, list):
+                raise ValueError("Expected a list of standings")
+
             self.logger.info("Successfully fetched data", 
                            extra={
                                'teams_count': len(data),
                                'season': season
                            })
+            self._cache[key] = (now, data)
             return data
 
         except requests.exceptions.RequestException as e:
@@ -160,45 +288,90 @@ class NBAStatsPipeline:
                             })
             return None
 
-    def store_team_stats(self, stats_data):
-        """Store team statistics in DynamoDB"""
+    def fetch_seasons(self, seasons):
+        """Fetch several seasons concurrently, returning {season: data}"""
+        seasons = list(seasons)
+        if not seasons:
+            return {}
+
+        # The shared session's connection pool is safe to use from these threads
+        with ThreadPoolExecutor(max_workers=min(len(seasons), MAX_FETCH_WORKERS)) as executor:
+            return dict(zip(seasons, executor.map(self.fetch_player_stats, seasons)))
+
+    def store_team_stats(self, stats_data, use_transaction=False):
+        """Store team statistics in DynamoDB, atomically if use_transaction is set
+
+        Teams whose stats are unchanged since the last write are skipped, so a
+        transaction covers only the changed teams, not the whole standings.
+        """
         try:
-            table = self.dynamodb.Table(self.table_name)
-            timestamp = datetime.now().isoformat()
+            # One timestamp per run keeps the sort key consistent across the batch
+            timestamp = datetime.now(timezone.utc).isoformat()
             
             self.logger.info("Starting batch write to DynamoDB")
             
-            with table.batch_writer() as batch:
-                for team in stats_data:
-                    # Create base item
-                    team_item = {
-                        'TeamID': team['TeamID'],
-                        'Timestamp': timestamp,
-                        'TeamKey': team['Key'],
-                        'TeamName': f"{team['City']} {team['Name']}",
-                        'Conference': team['Conference'],
-                        'Division': team['Division'],
-                        'Stats': self.convert_floats_to_decimals({
-                            'Wins': team['Wins'],
-                            'Losses': team['Losses'],
-                            'Percentage': team['Percentage'],
-                            'PointsPerGameFor': team['PointsPerGameFor'],
-                            'PointsPerGameAgainst': team['PointsPerGameAgainst'],
-                            'HomeWins': team['HomeWins'],
-                            'HomeLosses': team['HomeLosses'],
-                            'AwayWins': team['AwayWins'],
-                            'AwayLosses': team['AwayLosses'],
-                            'LastTenWins': team['LastTenWins'],
-                            'LastTenLosses': team['LastTenLosses']
-                        }),
-                        'LastUpdated': datetime.now().isoformat()
+            write_requests = []
+            changed = {}
+            for team in stats_data:
+                stat_values = _STATS_GET(team)
+                team_stats = dict(zip(_STAT_KEYS, stat_values))
+                stats_hash = hashlib.blake2b(
+                    json.dumps(team_stats, sort_keys=True).encode(),
+                    digest_size=8
+                ).hexdigest()
+
+                # Standings rarely move between runs; skip teams we've already stored
+                if self._stats_hashes.get(team['TeamID']) == stats_hash:
+                    continue
+                changed[team['TeamID']] = (team['Key'], stats_hash)
+
+                team_name = self._name_cache.get(team['TeamID'])
+                if team_name is None:
+                    team_name = self._name_cache[team['TeamID']] = team['City'] + ' ' + team['Name']
+
+                # Create base item
+                team_item = {
+                    'TeamID': team['TeamID'],
+                    'Timestamp': timestamp,
+                    'TeamKey': team['Key'],
+                    'Conference': team['Conference'],
+                    'Division': team['Division'],
+                    'TeamName': team_name,
+                    'Stats': dict(zip(_STAT_KEYS, map(to_decimal, stat_values))),
+                    'StatsHash': stats_hash,
+                    'LastUpdated': timestamp
+                }
+
+                write_requests.append({
+                    'PutRequest': {
+                        'Item': _SERIALIZER.serialize(team_item)['M']
                     }
-                    
-                    self.logger.info(f"Storing data for team: {team_item['TeamName']}")
-                    batch.put_item(Item=team_item)
+                })
+
+            if use_transaction:
+                # Covers only the teams whose stats changed, not the whole standings
+                self.transact_write(write_requests)
+            else:
+                # BatchWriteItem chosen over TransactWriteItems: per-team writes are
+                # independent; no 2x WCU penalty (see AWS BatchWriteItem docs)
+                chunks = list(chunked(write_requests, BATCH_WRITE_SIZE))
+
+                # Chunks are independent, so send them concurrently
+                if len(chunks) > 1:
+                    with ThreadPoolExecutor(max_workers=min(len(chunks), MAX_WRITE_WORKERS)) as executor:
+                        list(executor.map(self.batch_write, chunks))
+                elif chunks:
+                    self.batch_write(chunks[0])
+
+            for team_id, (_, stats_hash) in changed.items():
+                self._stats_hashes[team_id] = stats_hash
                 
             self.logger.info("Successfully stored team stats", 
-                            extra={'teams_count': len(stats_data)})
+                            extra={
+                                'teams_count': len(changed),
+                                'skipped_count': len(stats_data) - len(changed),
+                                'teams': [team_key for team_key, _ in changed.values()]
+                            })
                             
         except Exception as e:
             self.logger.error("Failed to store team stats", 
@@ -208,6 +381,54 @@ class NBAStatsPipeline:
                              })
             raise
 
+    def batch_write(self, write_requests):
+        """Write up to 25 requests, retrying UnprocessedItems with backoff"""
+        request_items = {self.table_name: write_requests}
+        attempt = 0
+
+        while request_items:
+            response = self.ddb.batch_write_item(RequestItems=request_items)
+            request_items = response.get('UnprocessedItems')
+            if not request_items:
+                break
+
+            unprocessed = len(request_items.get(self.table_name, []))
+            if attempt >= MAX_BATCH_RETRIES:
+                raise RuntimeError(
+                    f"{unprocessed} items still unprocessed after {attempt} retries"
+                )
+
+            self.logger.warning("Retrying unprocessed items",
+                              extra={
+                                  'unprocessed_count': unprocessed,
+                                  'attempt': attempt + 1
+                              })
+            # Exponential backoff with jitter, capped at one second
+            time.sleep(min(2 ** attempt * 0.05 + random.random() * 0.05, 1.0))
+            attempt += 1
+
+    def transact_write(self, write_requests):
+        """Write all requests in a single all-or-nothing transaction"""
+        if not write_requests:
+            return
+        if len(write_requests) > MAX_TRANSACTION_SIZE:
+            raise ValueError(
+                f"Cannot write {len(write_requests)} items in one transaction "
+                f"(limit is {MAX_TRANSACTION_SIZE})"
+            )
+
+        self.ddb.transact_write_items(
+            TransactItems=[
+                {
+                    'Put': {
+                        'TableName': self.table_name,
+                        'Item': request['PutRequest']['Item']
+                    }
+                }
+                for request in write_requests
+            ]
+        )
+
 def main():
     try:
         pipeline = NBAStatsPipeline()